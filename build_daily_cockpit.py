@@ -1,180 +1,330 @@
+import argparse
+import hashlib
 import json
 import math
 import numbers
-from datetime import datetime
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from functools import lru_cache
 from pathlib import Path
 from textwrap import dedent
 
+import numpy as np
+import orjson
 import pandas as pd
-import yfinance as yf
 
 SOURCE = Path(r"C:/Users/bgand/.openclaw/media/inbound/e5dc6078-2b7f-4d35-9ed3-8b4f2a89c10e.xlsx")
 OUTPUT = Path("portfolio-control-room.html")
 DIGEST = Path("portfolio-daily-digest.txt")
 NOTES_PATH = Path("portfolio-notes.json")
+SOURCE_COLUMNS = [
+    "Symbol",
+    "Stock Name",
+    "Units",
+    "Buy price",
+    "Sell price",
+    "Current Price",
+    "Price As of Dec 19 2025",
+    "Target (20%)",
+]
+QUOTES_SNAPSHOT = Path("portfolio-quotes.json")
+QUOTES_STAMP = Path("portfolio-quotes-timestamp.txt")
+QUOTE_CACHE_DIR = Path(".cache/quotes")
+QUOTE_CACHE_TTL = 10 * 60
+TRIGGER_LABELS = np.array(
+    [
+        "▼ Day drop >3%",
+        "▼ Week drop >10%",
+        "▼ 15% under buy",
+        "▼ 20% under Dec ref",
+        "🎯 Target reached",
+    ]
+)
+PLACEHOLDER = re.compile(r"__([A-Z_]+?)__")
+RECORD_FIELDS = {
+    "Stock Name": "name",
+    "Symbol_clean": "symbol",
+    "Units": "units",
+    "Buy": "buy",
+    "Current": "current",
+    "CostBasis": "costBasis",
+    "CurrentValue": "currentValue",
+    "Pct_vs_buy": "pctVsBuy",
+    "Pct_vs_dec": "pctVsDec",
+    "DayChange": "dayChange",
+    "DayPct": "dayPct",
+    "WeekPct": "weekPct",
+    "Target": "target",
+    "DayDollar": "dayDollar",
+    "status": "status",
+    "triggers": "triggers",
+    "note": "note",
+}
 
 
-def parse_money(value):
-    if isinstance(value, str):
-        clean = value.replace("$", "").replace(",", "").strip()
-        if not clean:
-            return None
-        try:
-            return float(clean)
-        except ValueError:
-            return None
-    if value in ("", None):
-        return None
-    try:
-        return float(value)
-    except (TypeError, ValueError):
-        return None
+def parse_money_column(values):
+    cleaned = values.astype(str).str.replace("$", "", regex=False).str.replace(",", "", regex=False).str.strip()
+    return pd.to_numeric(cleaned, errors="coerce")
+
+
+format_pct1 = "{:+.1f}%".format
+format_money2 = "${:,.2f}".format
 
 
 def pct_format(value, decimals=1):
     if value is None or pd.isna(value):
         return "—"
+    if decimals == 1:
+        return format_pct1(value)
     return f"{value:+.{decimals}f}%"
 
 
 def money_format(value, decimals=2):
     if value is None or pd.isna(value):
         return "—"
+    if decimals == 2:
+        return format_money2(value)
     return f"${value:,.{decimals}f}"
 
 
+def parse_quote(history):
+    history = history.dropna(subset=["Close"])
+    if history.empty:
+        return None
+    closes = history["Close"]
+    price = float(closes.iloc[-1])
+    prev_close = float(closes.iloc[-2]) if len(closes) > 1 else None
+    day_change = price - prev_close if prev_close else None
+    day_pct = (day_change / prev_close * 100) if prev_close else None
+    week_ago = float(closes.iloc[0]) if len(closes) >= 5 else None
+    week_pct = ((price - week_ago) / week_ago * 100) if week_ago else None
+    return {
+        "price": price,
+        "prev_close": prev_close,
+        "day_change": day_change,
+        "day_pct": day_pct,
+        "week_pct": week_pct,
+    }
+
+
 def fetch_quote(symbol: str):
+    import yfinance as yf
+
     try:
-        data = yf.download(symbol, period="5d", interval="1d", progress=False, auto_adjust=False)
-        data = data.dropna(subset=["Close"])
-        if data.empty:
-            return None
-        last = data.iloc[-1]
-        prev = data.iloc[-2] if len(data) > 1 else None
-        price = float(last["Close"])
-        prev_close = float(prev["Close"]) if prev is not None else None
-        day_change = price - prev_close if prev_close else None
-        day_pct = (day_change / prev_close * 100) if prev_close else None
-        week_ago = data.iloc[0]["Close"] if len(data) >= 5 else None
-        week_pct = ((price - week_ago) / week_ago * 100) if week_ago else None
-        return {
-            "price": price,
-            "prev_close": prev_close,
-            "day_change": day_change,
-            "day_pct": day_pct,
-            "week_pct": week_pct,
-        }
+        data = yf.download([symbol], period="5d", interval="1d", group_by="ticker", progress=False, auto_adjust=False)
+        return parse_quote(data[symbol])
     except Exception:
         return None
 
 
-def fetch_quotes(symbols):
+def quote_cache_path(symbol):
+    key = hashlib.md5(f"{symbol}|{date.today()}".encode()).hexdigest()
+    return QUOTE_CACHE_DIR / f"{key}.json"
+
+
+def read_cached_quote(symbol):
+    try:
+        entry = json.loads(quote_cache_path(symbol).read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        return None
+    if time.time() - entry.get("ts", 0) < QUOTE_CACHE_TTL:
+        return entry.get("quote")
+    return None
+
+
+def write_cached_quote(symbol, quote):
+    path = quote_cache_path(symbol)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    try:
+        QUOTE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp.write_text(json.dumps({"ts": time.time(), "quote": quote}), encoding="utf-8")
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+
+def download_quotes(symbols):
+    import yfinance as yf
+
     quotes = {}
-    for symbol in symbols:
-        clean = symbol.strip().upper()
-        if not clean or clean in quotes:
-            continue
-        quote = fetch_quote(clean)
+    try:
+        data = yf.download(
+            symbols,
+            period="5d",
+            interval="1d",
+            group_by="ticker",
+            threads=True,
+            auto_adjust=False,
+            progress=False,
+        )
+        fetched = set(data.columns.get_level_values(0))
+        for symbol in symbols:
+            if symbol not in fetched:
+                continue
+            quote = parse_quote(data[symbol])
+            if quote:
+                quotes[symbol] = quote
+    except Exception:
+        pass
+
+    # Retry whatever the batch call dropped one symbol at a time, overlapping the requests.
+    missing = [s for s in symbols if s not in quotes]
+    if missing:
+        with ThreadPoolExecutor(max_workers=min(16, len(missing))) as executor:
+            for symbol, quote in zip(missing, executor.map(fetch_quote, missing)):
+                if quote:
+                    quotes[symbol] = quote
+    return quotes
+
+
+def fetch_quotes(symbols, use_cache=True):
+    symbols = list(dict.fromkeys(s.strip().upper() for s in symbols if s.strip()))
+    quotes = {}
+    for symbol in symbols if use_cache else ():
+        quote = read_cached_quote(symbol)
         if quote:
-            quotes[clean] = quote
+            quotes[symbol] = quote
+
+    pending = [s for s in symbols if s not in quotes]
+    if pending:
+        fresh = download_quotes(pending)
+        for symbol, quote in fresh.items():
+            write_cached_quote(symbol, quote)
+        quotes.update(fresh)
     return quotes
 
 
-def classify(row):
-    triggers = []
-    day_pct = row.get("DayPct") or 0
-    pct_buy = row.get("Pct_vs_buy") or 0
-    pct_dec = row.get("Pct_vs_dec") or 0
-    week_pct = row.get("WeekPct") or 0
-    target = row.get("Target")
-    current = row.get("Current")
-
-    if day_pct <= -3:
-        triggers.append("▼ Day drop >3%")
-    if week_pct <= -10:
-        triggers.append("▼ Week drop >10%")
-    if pct_buy <= -15:
-        triggers.append("▼ 15% under buy")
-    if pct_dec <= -20:
-        triggers.append("▼ 20% under Dec ref")
-    if target and current and current >= target:
-        triggers.append("🎯 Target reached")
-
-    if not triggers:
-        status = "stable"
-    elif any(t.startswith("▼") for t in triggers):
-        status = "attention"
-    else:
-        status = "action"
+def load_quote_snapshot():
+    # The stamp is the epoch time of the fetch; the snapshot expires with the per-symbol cache.
+    try:
+        fetched_at = float(QUOTES_STAMP.read_text(encoding="utf-8").strip())
+        if time.time() - fetched_at >= QUOTE_CACHE_TTL:
+            return {}, None
+        return json.loads(QUOTES_SNAPSHOT.read_text(encoding="utf-8")), fetched_at
+    except (OSError, ValueError):
+        return {}, None
+
 
+def save_quote_snapshot(quotes, fetched_at):
+    try:
+        QUOTES_SNAPSHOT.write_text(json.dumps(quotes), encoding="utf-8")
+        QUOTES_STAMP.write_text(repr(fetched_at), encoding="utf-8")
+    except OSError:
+        pass
+
+
+def classify(holdings):
+    target = holdings["Target"]
+    current = holdings["Current"]
+    m_day = (holdings["DayPct"].fillna(0) <= -3).to_numpy()
+    m_week = (holdings["WeekPct"].fillna(0) <= -10).to_numpy()
+    m_buy = (holdings["Pct_vs_buy"].fillna(0) <= -15).to_numpy()
+    m_dec = (holdings["Pct_vs_dec"].fillna(0) <= -20).to_numpy()
+    m_target = (target.fillna(0).ne(0) & current.fillna(0).ne(0) & current.ge(target)).to_numpy()
+
+    mask_matrix = np.column_stack([m_day, m_week, m_buy, m_dec, m_target])
+    triggers = [TRIGGER_LABELS[row].tolist() for row in mask_matrix]
+    status = pd.Categorical(
+        np.select([mask_matrix[:, :4].any(axis=1), m_target], ["attention", "action"], default="stable"),
+        categories=["attention", "action", "stable"],
+    )
     return status, triggers
 
 
 def load_notes():
-    if NOTES_PATH.exists():
-        try:
-            return json.loads(NOTES_PATH.read_text(encoding="utf-8"))
-        except json.JSONDecodeError:
-            return {}
-    return {}
-
-
-def clean_for_json(value):
-    if isinstance(value, dict):
-        return {k: clean_for_json(v) for k, v in value.items()}
-    if isinstance(value, list):
-        return [clean_for_json(v) for v in value]
+    try:
+        mtime = NOTES_PATH.stat().st_mtime_ns
+    except OSError:
+        return {}
+    return read_notes(mtime)
+
+
+@lru_cache(maxsize=1)
+def read_notes(mtime):
+    try:
+        return json.loads(NOTES_PATH.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def json_default(value):
     if isinstance(value, (pd.Series, pd.Index)):
-        return clean_for_json(value.tolist())
+        return value.tolist()
     if isinstance(value, pd.Timestamp):
         return value.isoformat()
     if isinstance(value, numbers.Number):
         if pd.isna(value) or math.isinf(value):
             return None
         return float(value)
-    return value
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
 
 
-def build():
-    df = pd.read_excel(SOURCE)
-    df["Symbol_clean"] = df["Symbol"].astype(str).str.strip().str.upper()
+def dumps(value):
+    return orjson.dumps(value, default=json_default, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+
+
+def read_holdings():
+    cache = SOURCE.with_suffix(".pkl")
+    key = (SOURCE.stat().st_mtime_ns, tuple(SOURCE_COLUMNS))
+    try:
+        cached_key, df = pd.read_pickle(cache)
+        if cached_key == key:
+            return df
+    except Exception:
+        pass
+    df = pd.read_excel(SOURCE, usecols=SOURCE_COLUMNS, engine="openpyxl")
+    tmp = cache.with_suffix(f".{os.getpid()}.tmp")
+    try:
+        pd.to_pickle((key, df), tmp)
+        os.replace(tmp, cache)
+    except OSError:
+        pass
+    return df
+
+
+def build(force=False):
+    df = read_holdings()
+    df["Symbol_clean"] = df["Symbol"].astype(str).str.strip().str.upper().astype("category")
     symbols = [s for s in df["Symbol_clean"].dropna().unique() if s and s != "NAN"]
-    quotes = fetch_quotes(symbols)
+    quotes, fetched_at = ({}, None) if force else load_quote_snapshot()
+    missing = [s for s in symbols if s not in quotes]
+    if missing:
+        quotes.update(fetch_quotes(missing, use_cache=not force))
+        # Topping up keeps the original stamp so older entries still expire on time.
+        save_quote_snapshot(quotes, fetched_at or time.time())
 
     df["Units"] = pd.to_numeric(df["Units"], errors="coerce")
-    df["Buy"] = df["Buy price"].apply(parse_money)
-    df["Sell"] = df["Sell price"].apply(parse_money)
-    df["CurrentExcel"] = df["Current Price"].apply(parse_money)
+    df["Buy"] = parse_money_column(df["Buy price"])
+    df["Sell"] = parse_money_column(df["Sell price"])
+    df["CurrentExcel"] = parse_money_column(df["Current Price"])
     df["DecRef"] = pd.to_numeric(df["Price As of Dec 19 2025"], errors="coerce")
     df["Target"] = pd.to_numeric(df["Target (20%)"], errors="coerce")
 
-    def current_from_quote(row):
-        sym = row["Symbol_clean"]
-        quote = quotes.get(sym)
-        if quote:
-            return quote["price"]
-        return row["CurrentExcel"]
-
-    def metric_from_quote(row, field):
-        sym = row["Symbol_clean"]
-        quote = quotes.get(sym)
-        if quote:
-            return quote.get(field)
-        return None
-
-    df["Current"] = df.apply(current_from_quote, axis=1)
-    df["DayChange"] = df.apply(lambda r: metric_from_quote(r, "day_change"), axis=1)
-    df["DayPct"] = df.apply(lambda r: metric_from_quote(r, "day_pct"), axis=1)
-    df["WeekPct"] = df.apply(lambda r: metric_from_quote(r, "week_pct"), axis=1)
-
-    df["Pct_vs_buy"] = ((df["Current"] - df["Buy"]) / df["Buy"]) * 100
-    df["Pct_vs_dec"] = ((df["Current"] - df["DecRef"]) / df["DecRef"]) * 100
-    df["CostBasis"] = df["Units"] * df["Buy"]
-    df["CurrentValue"] = df["Units"] * df["Current"]
-    df["DayDollar"] = df["Units"] * df["DayChange"]
+    quote_frame = pd.DataFrame.from_dict(
+        quotes, orient="index", columns=["price", "prev_close", "day_change", "day_pct", "week_pct"]
+    ).astype(float)
+    matched = quote_frame.reindex(df["Symbol_clean"]).set_axis(df.index)
+    df["Current"] = matched["price"].fillna(df["CurrentExcel"])
+    df["DayChange"] = matched["day_change"]
+    df["DayPct"] = matched["day_pct"]
+    df["WeekPct"] = matched["week_pct"]
+
+    df.eval(
+        """
+        Pct_vs_buy = (Current - Buy) / Buy * 100
+        Pct_vs_dec = (Current - DecRef) / DecRef * 100
+        CostBasis = Units * Buy
+        CurrentValue = Units * Current
+        DayDollar = Units * DayChange
+        """,
+        inplace=True,
+    )
 
     holdings = df[df["Units"].fillna(0) > 0].copy()
-    holdings = holdings.sort_values("Pct_vs_buy", ascending=True)
+    holdings = holdings.sort_values("Pct_vs_buy", ascending=True).reset_index(drop=True)
 
     total_cost = holdings["CostBasis"].sum(min_count=1) or 0
     total_value = holdings["CurrentValue"].sum(min_count=1) or 0
@@ -184,41 +334,22 @@ def build():
     pct_gain = ((total_value - total_cost) / total_cost * 100) if total_cost else 0
 
     notes = load_notes()
-    records = []
-    attention = []
-
-    for _, row in holdings.iterrows():
-        status, triggers = classify(row)
-        symbol = row["Symbol_clean"]
-        record = {
-            "name": row["Stock Name"],
-            "symbol": symbol,
-            "units": float(row["Units"] or 0),
-            "buy": row["Buy"],
-            "current": row["Current"],
-            "costBasis": row["CostBasis"],
-            "currentValue": row["CurrentValue"],
-            "pctVsBuy": row["Pct_vs_buy"],
-            "pctVsDec": row["Pct_vs_dec"],
-            "dayChange": row["DayChange"],
-            "dayPct": row["DayPct"],
-            "weekPct": row["WeekPct"],
-            "target": row["Target"],
-            "status": status,
-            "triggers": triggers,
-            "note": notes.get(symbol, ""),
-            "dayDollar": row["DayDollar"],
-        }
-        if triggers:
-            attention.append(record)
-        records.append(record)
-
-    attention_sorted = sorted(attention, key=lambda r: (r["dayPct"] or -999))
-    top_losers = sorted(records, key=lambda r: (r["dayPct"] or 0))[:5]
-    top_winners = sorted(records, key=lambda r: (r["dayPct"] or 0), reverse=True)[:5]
-
+    holdings["status"], holdings["triggers"] = classify(holdings)
+    holdings["note"] = holdings["Symbol_clean"].map(notes).astype(object).fillna("")
+    records = holdings[list(RECORD_FIELDS)].rename(columns=RECORD_FIELDS).to_dict("records")
+
+    # holdings has a fresh RangeIndex, so index labels double as positions in records.
+    attention_idx = np.flatnonzero(holdings["status"].ne("stable"))
+    flag_count = len(attention_idx)
+    flagged_day_pct = holdings["DayPct"].fillna(-999).iloc[attention_idx]
+    attention_sorted = [records[i] for i in flagged_day_pct.nsmallest(10).index]
+    day_pct = holdings["DayPct"].fillna(0)
+    top_losers = [records[i] for i in day_pct.nsmallest(5).index]
+    top_winners = [records[i] for i in day_pct.nlargest(5).index]
+
+    now = datetime.now()
     digest_lines = [
-        f"Snapshot {datetime.now().strftime('%b %d %H:%M')} — Net {money_format(total_value - total_cost)} ({pct_format(pct_gain)})",
+        f"Snapshot {now.strftime('%b %d %H:%M')} — Net {money_format(total_value - total_cost)} ({pct_format(pct_gain)})",
         f"Market value {money_format(total_value)} · Cost basis {money_format(total_cost)} · Today {money_format(day_move)}",
         "--- Movers ---",
     ]
@@ -226,15 +357,14 @@ def build():
         digest_lines.append(
             f"{rec['symbol']}: {pct_format(rec['dayPct'])} today · vs buy {pct_format(rec['pctVsBuy'])} · note {rec['note'] or '—'}"
         )
-    DIGEST.write_text("\n".join(digest_lines), encoding="utf-8")
 
-    generated_at = datetime.now().strftime("%Y-%m-%d %H:%M")
-    top_symbol = records[-1]["symbol"] if records else "—"
+    generated_at = now.strftime("%Y-%m-%d %H:%M")
+    top_symbol = str(records[-1]["symbol"]) if records else "—"
 
-    records_json = json.dumps(clean_for_json(records))
-    attention_json = json.dumps(clean_for_json(attention_sorted[:10]))
-    winners_json = json.dumps(clean_for_json(top_winners))
-    losers_json = json.dumps(clean_for_json(top_losers))
+    records_json = dumps(records)
+    attention_json = dumps(attention_sorted)
+    winners_json = dumps(top_winners)
+    losers_json = dumps(top_losers)
 
     template = dedent(
         """<!doctype html>
@@ -499,25 +629,33 @@ renderMovers(losers, 'losers');
 </html>"""
     )
 
-    html = (
-        template
-        .replace("__GENERATED_AT__", generated_at)
-        .replace("__HOLDING_COUNT__", str(len(records)))
-        .replace("__COST_BASIS__", money_format(total_cost))
-        .replace("__MARKET_VALUE__", money_format(total_value))
-        .replace("__DAY_MOVE__", money_format(day_move))
-        .replace("__NET_PCT__", pct_format(pct_gain))
-        .replace("__NET_VALUE__", money_format(total_value - total_cost))
-        .replace("__TOP_SYMBOL__", top_symbol)
-        .replace("__FLAGS__", str(len(attention_sorted)))
-        .replace("__RECORDS_JSON__", records_json)
-        .replace("__ATTENTION_JSON__", attention_json)
-        .replace("__WINNERS_JSON__", winners_json)
-        .replace("__LOSERS_JSON__", losers_json)
-    )
-
-    OUTPUT.write_text(html, encoding="utf-8")
+    values = {
+        "GENERATED_AT": generated_at,
+        "HOLDING_COUNT": str(len(records)),
+        "COST_BASIS": money_format(total_cost),
+        "MARKET_VALUE": money_format(total_value),
+        "DAY_MOVE": money_format(day_move),
+        "NET_PCT": pct_format(pct_gain),
+        "NET_VALUE": money_format(total_value - total_cost),
+        "TOP_SYMBOL": top_symbol,
+        "FLAGS": str(flag_count),
+        "RECORDS_JSON": records_json,
+        "ATTENTION_JSON": attention_json,
+        "WINNERS_JSON": winners_json,
+        "LOSERS_JSON": losers_json,
+    }
+    html = PLACEHOLDER.sub(lambda m: values[m.group(1)], template)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        writes = [
+            executor.submit(DIGEST.write_text, "\n".join(digest_lines), encoding="utf-8"),
+            executor.submit(OUTPUT.write_text, html, encoding="utf-8"),
+        ]
+        for write in writes:
+            write.result()
 
 
 if __name__ == "__main__":
-    build()
+    parser = argparse.ArgumentParser(description="Rebuild the portfolio control room and daily digest.")
+    parser.add_argument("--force", action="store_true", help="ignore saved quotes and refetch everything")
+    build(force=parser.parse_args().force)
@@ -1,171 +1,233 @@
+import importlib.util
 import json
+import logging
 import math
 import time
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from functools import lru_cache
 from pathlib import Path
-from textwrap import dedent
 
+import numpy as np
+import orjson
 import pandas as pd
-import yfinance as yf
+
+logger = logging.getLogger(__name__)
 
 SOURCE = Path(r"C:/Users/bgand/.openclaw/media/inbound/e5dc6078-2b7f-4d35-9ed3-8b4f2a89c10e.xlsx")
 OUTPUT = Path("portfolio-mvp.html")
 SUMMARY = Path("portfolio-updates.txt")
+SOURCE_COLUMNS = ["Stock Name", "Symbol", "Units", "Buy price", "Current Price", "Price As of Dec 19 2025"]
+SOURCE_DTYPES = {
+    "Symbol": "string",
+    "Buy price": "string",
+    "Current Price": "string",
+}
+STATIC_CACHE = Path(".cache/portfolio-static.pkl")
+# Bump whenever prepare_static_columns changes the cached frame's shape.
+STATIC_CACHE_VERSION = 2
+QUOTE_CACHE_DIR = Path.home() / ".cache" / "portfolio-mvp"
+QUOTE_RETRIES = 3
+QUOTE_BACKOFF = 0.5
+QUOTE_MEMO = {}
+RECORD_FIELDS = {
+    "Stock Name": "name",
+    "Symbol_clean": "symbol",
+    "Units": "units",
+    "Buy": "buy",
+    "Current": "current",
+    "CostBasis": "costBasis",
+    "CurrentValue": "currentValue",
+    "Pct_vs_buy": "pctVsBuy",
+    "Pct_vs_dec": "pctVsDec",
+    "DayChange": "dayChange",
+    "DayPct": "dayPct",
+}
+
+
+def parse_money_column(values):
+    cleaned = values.str.replace("$", "", regex=False).str.replace(",", "", regex=False).str.strip()
+    return pd.to_numeric(cleaned, errors="coerce")
+
+
+format_pct1 = "{:+.1f}%".format
+format_money2 = "${:,.2f}".format
 
 
-def parse_money(value):
-    if isinstance(value, str):
-        clean = value.replace("$", "").replace(",", "").strip()
-        if not clean:
-            return None
-        try:
-            return float(clean)
-        except ValueError:
-            return None
-    if value in ("", None):
-        return None
-    try:
-        return float(value)
-    except (TypeError, ValueError):
-        return None
-
-
-def pct_format(value):
+def money_format(value):
     if value is None or pd.isna(value):
         return ""
-    return f"{value:+.1f}%"
+    return format_money2(value)
 
 
-def money_format(value):
-    if value is None or pd.isna(value):
-        return ""
-    return f"${value:,.2f}"
+def format_series(values, formatter, missing="n/a"):
+    numbers = values.to_numpy(dtype=np.float64, na_value=np.nan)
+    finite = np.isfinite(numbers)
+    out = np.full(len(numbers), missing, dtype=object)
+    out[finite] = [formatter(v) for v in numbers[finite]]
+    return pd.Series(out, index=values.index)
 
 
-def fetch_quote(symbol: str):
-    try:
-        data = yf.download(symbol, period="2d", interval="1d", progress=False, auto_adjust=False)
-        data = data.dropna(subset=["Close"])
-        if data.empty:
-            return None
-        last = data.iloc[-1]
-        prev = data.iloc[-2] if len(data) > 1 else None
-        price = float(last["Close"])
-        prev_close = float(prev["Close"]) if prev is not None else None
-        day_change = price - prev_close if prev_close else None
-        day_pct = (day_change / prev_close * 100) if prev_close else None
-        return {
-            "price": price,
-            "prev_close": prev_close,
-            "day_change": day_change,
-            "day_pct": day_pct,
-        }
-    except Exception:
+def parse_quote(history):
+    history = history.dropna(subset=["Close"])
+    if history.empty:
         return None
+    closes = history["Close"]
+    price = float(closes.iloc[-1])
+    prev_close = float(closes.iloc[-2]) if len(closes) > 1 else None
+    day_change = price - prev_close if prev_close else None
+    day_pct = (day_change / prev_close * 100) if prev_close else None
+    return {
+        "price": price,
+        "prev_close": prev_close,
+        "day_change": day_change,
+        "day_pct": day_pct,
+    }
 
 
-def fetch_quotes(symbols):
-    quotes = {}
-    for symbol in symbols:
-        clean = symbol.strip().upper()
-        if not clean or clean in quotes:
-            continue
-        quote = fetch_quote(clean)
+def fetch_quote(symbol: str):
+    # Only successful quotes are memoized, so a failed symbol always goes back through the
+    # retry/backoff loop; the minute bucket expires them so long-running callers still refresh.
+    bucket = int(time.time() // 60)
+    memo = QUOTE_MEMO.get(symbol)
+    if memo and memo[0] == bucket:
+        return memo[1]
+    quote = fetch_quote_with_retry(symbol)
+    if quote:
+        QUOTE_MEMO[symbol] = (bucket, quote)
+    return quote
+
+
+def fetch_quote_with_retry(symbol: str):
+    import yfinance as yf
+
+    # yfinance reports throttled or failed requests as an empty frame rather than raising,
+    # so an empty/unparseable response is what gets retried with backoff.
+    for attempt in range(QUOTE_RETRIES):
+        try:
+            data = yf.download([symbol], period="2d", interval="1d", group_by="ticker", progress=False, auto_adjust=False)
+            quote = parse_quote(data[symbol])
+        except (KeyError, ValueError, IndexError):
+            quote = None
         if quote:
-            quotes[clean] = quote
-        time.sleep(0.2)
-    return quotes
+            return quote
+        if attempt + 1 < QUOTE_RETRIES:
+            time.sleep(QUOTE_BACKOFF * 2**attempt)
+    return None
 
 
-def build():
-    df = pd.read_excel(SOURCE)
+def quote_cache_path():
+    return QUOTE_CACHE_DIR / f"quotes-{date.today():%Y%m%d}.json"
 
-    df["Symbol_clean"] = df["Symbol"].astype(str).str.strip().str.upper()
-    symbols = [s for s in df["Symbol_clean"].dropna().unique() if s and s != "NAN"]
-    quotes = fetch_quotes(symbols)
 
-    df["Buy"] = df["Buy price"].apply(parse_money)
-    df["Units"] = pd.to_numeric(df["Units"], errors="coerce")
-    df["Dec19"] = pd.to_numeric(df["Price As of Dec 19 2025"], errors="coerce")
+@lru_cache(maxsize=1)
+def load_quote_cache(path):
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        return {}
 
-    def current_from_quote(row):
-        sym = row["Symbol_clean"]
-        quote = quotes.get(sym)
-        if quote:
-            return quote["price"]
-        return parse_money(row["Current Price"])
 
-    def day_change_from_quote(row, field):
-        sym = row["Symbol_clean"]
-        quote = quotes.get(sym)
-        if quote:
-            return quote[field]
-        return None
+def save_quote_cache(path, quotes):
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(quotes), encoding="utf-8")
+    except OSError:
+        return
+    load_quote_cache.cache_clear()
 
-    df["Current"] = df.apply(current_from_quote, axis=1)
-    df["DayChange"] = df.apply(lambda r: day_change_from_quote(r, "day_change"), axis=1)
-    df["DayPct"] = df.apply(lambda r: day_change_from_quote(r, "day_pct"), axis=1)
 
-    df["Pct_vs_buy"] = ((df["Current"] - df["Buy"]) / df["Buy"]) * 100
-    df["Pct_vs_dec"] = ((df["Current"] - df["Dec19"]) / df["Dec19"]) * 100
-    df["CostBasis"] = df["Units"] * df["Buy"]
-    df["CurrentValue"] = df["Units"] * df["Current"]
+def download_quotes(symbols):
+    import yfinance as yf
 
-    holdings = df[df["Units"].fillna(0) > 0].copy()
-    holdings = holdings.sort_values("Pct_vs_buy", ascending=True)
+    quotes = {}
+    try:
+        data = yf.download(
+            symbols,
+            period="2d",
+            interval="1d",
+            group_by="ticker",
+            threads=True,
+            auto_adjust=False,
+            progress=False,
+        )
+        fetched = set(data.columns.get_level_values(0))
+        for symbol in symbols:
+            if symbol not in fetched:
+                continue
+            quote = parse_quote(data[symbol])
+            if quote:
+                quotes[symbol] = quote
+    except Exception as exc:
+        logger.warning("Batch quote download failed, fetching symbols one by one: %s", exc)
+
+    missing = [s for s in symbols if s not in quotes]
+    if missing:
+        with ThreadPoolExecutor(max_workers=min(10, len(missing))) as executor:
+            futures = [executor.submit(fetch_quote, symbol) for symbol in missing]
+        for symbol, future in zip(missing, futures):
+            error = future.exception()
+            quote = None if error else future.result()
+            if quote:
+                quotes[symbol] = quote
+            else:
+                logger.warning("No quote for %s: %s", symbol, error or "empty response")
+    return quotes
 
-    total_cost = holdings["CostBasis"].sum(min_count=1)
-    total_value = holdings["CurrentValue"].sum(min_count=1)
-    total_gain = total_value - total_cost
-    pct_gain = (total_gain / total_cost * 100) if total_cost else 0
 
-    view_cols = [
-        "Stock Name",
-        "Symbol",
-        "Symbol_clean",
-        "Units",
-        "Buy",
-        "Current",
-        "CostBasis",
-        "CurrentValue",
-        "Pct_vs_buy",
-        "Pct_vs_dec",
-        "DayChange",
-        "DayPct",
-    ]
-    view_df = holdings[view_cols].copy()
-
-    interactive_records = []
-    for _, row in view_df.iterrows():
-        sym_clean = row["Symbol_clean"]
-        interactive_records.append(
-            {
-                "name": row["Stock Name"],
-                "symbol": sym_clean,
-                "units": round(float(row["Units"]), 4) if not math.isnan(row["Units"]) else 0,
-                "buy": row["Buy"],
-                "current": row["Current"],
-                "costBasis": row["CostBasis"],
-                "currentValue": row["CurrentValue"],
-                "pctVsBuy": row["Pct_vs_buy"],
-                "pctVsDec": row["Pct_vs_dec"],
-                "dayChange": row["DayChange"],
-                "dayPct": row["DayPct"],
-            }
-        )
+def fetch_quotes(symbols):
+    symbols = list(dict.fromkeys(s.strip().upper() for s in symbols if s.strip()))
+    cache_path = quote_cache_path()
+    cached = load_quote_cache(cache_path)
+    quotes = {s: cached[s] for s in symbols if s in cached}
+
+    pending = [s for s in symbols if s not in quotes]
+    if pending:
+        fresh = download_quotes(pending)
+        if fresh:
+            save_quote_cache(cache_path, {**cached, **fresh})
+        quotes.update(fresh)
+    return quotes
 
-    summary_lines = []
-    for rec in interactive_records:
-        summary_lines.append(
-            f"- {rec['name']} ({rec['symbol']}) — {rec['units']:.2f} sh · Now {money_format(rec['current']) or 'n/a'} · "
-            f"Δ vs buy {pct_format(rec['pctVsBuy']) or 'n/a'} · Δ vs Dec19 {pct_format(rec['pctVsDec']) or 'n/a'} · "
-            f"Today {money_format(rec['dayChange']) or 'n/a'} ({pct_format(rec['dayPct']) or 'n/a'})"
-        )
 
-    SUMMARY.write_text("\n".join(summary_lines), encoding="utf-8")
+def read_holdings():
+    # Pick the engine before parsing so genuine data errors surface from the one read.
+    engine = "calamine" if importlib.util.find_spec("python_calamine") else "openpyxl"
+    return pd.read_excel(SOURCE, usecols=SOURCE_COLUMNS, dtype=SOURCE_DTYPES, engine=engine)
+
 
-    html = dedent(
-        """<!doctype html>
+def prepare_static_columns(df):
+    # Text columns arrive as string dtype; the numeric ones are coerced here rather than
+    # typed in read_excel, which would raise on a stray text cell instead of yielding NaN.
+    df["Symbol_clean"] = df["Symbol"].str.strip().str.upper().replace({"": pd.NA})
+    df["Buy"] = parse_money_column(df["Buy price"])
+    df["CurrentExcel"] = parse_money_column(df["Current Price"])
+    df["Units"] = pd.to_numeric(df["Units"], errors="coerce")
+    df["Dec19"] = pd.to_numeric(df["Price As of Dec 19 2025"], errors="coerce")
+    df["CostBasis"] = df["Units"].to_numpy(dtype=np.float64, na_value=np.nan) * df["Buy"].to_numpy(dtype=np.float64, na_value=np.nan)
+    return df
+
+
+def load_static_holdings():
+    # Everything that depends only on the workbook is reused until the workbook (or the
+    # cached layout) changes; the key records which file and version produced the frame.
+    key = (str(SOURCE.resolve()), SOURCE.stat().st_mtime_ns, STATIC_CACHE_VERSION)
+    try:
+        cached_key, df = pd.read_pickle(STATIC_CACHE)
+        if cached_key == key:
+            return df
+    except Exception:
+        pass
+    df = prepare_static_columns(read_holdings())
+    try:
+        STATIC_CACHE.parent.mkdir(parents=True, exist_ok=True)
+        pd.to_pickle((key, df), STATIC_CACHE)
+    except OSError:
+        pass
+    return df
+
+
+HTML_TEMPLATE = """<!doctype html>
 <html lang=\"en\">
 <head>
 <meta charset=\"utf-8\" />
@@ -370,17 +432,79 @@ footer {{ margin-top: 24px; font-size: 12px; color: #94a3b8; }}
   </script>
 </body>
 </html>"""
-    ).format(
+# build() streams the data blob between the two halves. The footer has no fields,
+# so its escaped braces are unescaped once here.
+HTML_HEAD, _, HTML_FOOT = HTML_TEMPLATE.partition("{data_json}")
+HTML_FOOT = HTML_FOOT.format()
+
+
+def build():
+    df = load_static_holdings()
+    symbols = df["Symbol_clean"].dropna().unique().tolist()
+    quotes = fetch_quotes(symbols)
+
+    price_map = {s: q["price"] for s, q in quotes.items()}
+    day_change_map = {s: q["day_change"] for s, q in quotes.items()}
+    day_pct_map = {s: q["day_pct"] for s, q in quotes.items()}
+    df["DayChange"] = df["Symbol_clean"].map(day_change_map).astype(float)
+    df["DayPct"] = df["Symbol_clean"].map(day_pct_map).astype(float)
+
+    # Drop to plain float64 here so the records below never carry pd.NA into orjson.
+    current = df["Symbol_clean"].map(price_map).astype(float).to_numpy()
+    current = np.where(np.isnan(current), df["CurrentExcel"].to_numpy(dtype=np.float64, na_value=np.nan), current)
+    buy = df["Buy"].to_numpy(dtype=np.float64, na_value=np.nan)
+    dec19 = df["Dec19"].to_numpy(dtype=np.float64, na_value=np.nan)
+    units = df["Units"].to_numpy(dtype=np.float64, na_value=np.nan)
+    df["Current"] = current
+    df["Buy"] = buy
+    df["Units"] = units
+    with np.errstate(divide="ignore", invalid="ignore"):
+        df["Pct_vs_buy"] = (current - buy) / buy * 100.0
+        df["Pct_vs_dec"] = (current - dec19) / dec19 * 100.0
+    df["CurrentValue"] = units * current
+
+    holdings = df[df["Units"].fillna(0) > 0].copy()
+    holdings = holdings.sort_values("Pct_vs_buy", ascending=True)
+
+    total_cost = holdings["CostBasis"].sum(min_count=1)
+    total_value = holdings["CurrentValue"].sum(min_count=1)
+    total_gain = total_value - total_cost
+    pct_gain = (total_gain / total_cost * 100) if total_cost else 0
+
+    view_df = holdings[list(RECORD_FIELDS)].rename(columns=RECORD_FIELDS)
+    view_df["units"] = view_df["units"].round(4)
+    view_df["symbol"] = view_df["symbol"].fillna("")
+    interactive_records = [
+        {key: None if isinstance(value, float) and not math.isfinite(value) else value for key, value in rec.items()}
+        for rec in view_df.to_dict(orient="records")
+    ]
+
+    summary_lines = (
+        "- " + view_df["name"].map(str) + " (" + view_df["symbol"].map(str) + ") — "
+        + view_df["units"].map("{:.2f}".format) + " sh · Now " + format_series(view_df["current"], format_money2)
+        + " · Δ vs buy " + format_series(view_df["pctVsBuy"], format_pct1)
+        + " · Δ vs Dec19 " + format_series(view_df["pctVsDec"], format_pct1)
+        + " · Today " + format_series(view_df["dayChange"], format_money2)
+        + " (" + format_series(view_df["dayPct"], format_pct1) + ")"
+    ).tolist()
+
+    SUMMARY.write_text("\n".join(summary_lines), encoding="utf-8")
+
+    # Encode before opening OUTPUT so an encoder error leaves the published page intact, then
+    # write the pieces as bytes so the blob is never held as both bytes and str.
+    data_json = orjson.dumps(interactive_records, option=orjson.OPT_SERIALIZE_NUMPY)
+    head = HTML_HEAD.format(
         generated_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S ET"),
         holding_count=len(view_df),
         total_cost=money_format(total_cost),
         total_value=money_format(total_value),
         total_gain=money_format(total_gain),
         pct_gain=pct_gain,
-        data_json=json.dumps(interactive_records)
     )
-
-    OUTPUT.write_text(html, encoding="utf-8")
+    with OUTPUT.open("wb") as f:
+        f.write(head.encode("utf-8"))
+        f.write(data_json)
+        f.write(HTML_FOOT.encode("utf-8"))
 
 
 if __name__ == "__main__":